@@ -0,0 +1,236 @@
+"""
+Digital Pathology Tutorial System Explainability Helpers
+
+Centralized helpers for:
+- Batched Grad-CAM with a single activation hook registered once per model
+- Streaming tile-level Grad-CAM into a bounded-memory slide-level saliency map
+"""
+
+from typing import Optional, Callable, Iterator, List, Tuple, Union
+from pathlib import Path
+
+import numpy as np
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+class GradCAM:
+    """Grad-CAM engine that keeps its hook on `target_layer` for its whole lifetime.
+
+    The forward hook is registered once in __init__ and reused for every batch
+    (it is inert outside __call__, so ordinary forward passes are unaffected);
+    gradients are taken at the target layer only, so no parameter grads are
+    allocated. Call remove() (or use the instance as a context manager) when done.
+    """
+
+    def __init__(self, model, target_layer):
+        self.model = model
+        self.target_layer = target_layer
+        self._out = None
+        self._armed = False
+        self._handles = [target_layer.register_forward_hook(self._fwd_hook)]
+
+    def _fwd_hook(self, module, inputs, output):
+        # Only act during __call__; ordinary forward passes are left untouched
+        if not self._armed:
+            return None
+        # Frozen backbones produce outputs without grad; re-root the graph here
+        if not output.requires_grad:
+            output = output.detach().requires_grad_()
+        self._out = output
+        # Hand a copy downstream so in-place ops (ReLU(inplace=True), residual
+        # `+=`) never modify the tensor we differentiate against
+        return output.clone()
+
+    def remove(self):
+        """Detach the hook from the target layer."""
+        for h in self._handles:
+            h.remove()
+        self._handles = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.remove()
+
+    def __call__(self, x, class_idx=None, upsample: bool = True, normalize: bool = True):
+        """Compute Grad-CAMs for a whole batch with a single forward/backward pass.
+
+        - x: input batch of shape (B, C, H, W); the model must be in eval mode.
+        - class_idx: None (per-sample argmax), a scalar class id, or B class ids.
+        - upsample: if True, resize CAMs to (H, W) in one vectorized interpolate call.
+        - normalize: if True, min-max scale each CAM to [0, 1].
+        Returns (cams, logits): cams is a (B, h, w) tensor, logits are detached.
+        """
+        import torch
+        import torch.nn.functional as F
+
+        if self.model.training:
+            raise RuntimeError("GradCAM needs the model in eval mode; call model.eval() first.")
+        self._out = None
+        self._armed = True
+        try:
+            with torch.enable_grad():
+                logits = self.model(x)
+        finally:
+            self._armed = False
+        out = self._out
+        self._out = None
+        if out is None:
+            raise RuntimeError("GradCAM target layer produced no activations: "
+                               "hooks were removed or the layer is not on the forward path.")
+        with torch.enable_grad():
+            batch = logits.shape[0]
+            if class_idx is None:
+                idx = logits.argmax(dim=1)
+            else:
+                idx = torch.as_tensor(class_idx, dtype=torch.long, device=logits.device)
+                if idx.dim() == 0:
+                    idx = idx.expand(batch)
+            if idx.shape != (batch,):
+                raise ValueError(f"class_idx must be a scalar or have shape ({batch},), got {tuple(idx.shape)}")
+            # Samples are independent in eval mode, so the gradient of the summed
+            # target scores gives each sample its own gradient in one backward pass.
+            score = logits.gather(1, idx.view(-1, 1)).sum()
+            grads = torch.autograd.grad(score, out)[0]
+
+        weights = grads.mean(dim=(2, 3), keepdim=True)
+        cams = F.relu((weights * out.detach()).sum(dim=1, keepdim=True))
+        if upsample:
+            cams = F.interpolate(cams, size=x.shape[-2:], mode='bilinear', align_corners=False)
+        cams = cams.squeeze(1)
+        if normalize:
+            flat = cams.flatten(1)
+            lo = flat.min(dim=1).values.view(-1, 1, 1)
+            hi = flat.max(dim=1).values.view(-1, 1, 1)
+            cams = (cams - lo) / (hi - lo + 1e-6)
+        return cams, logits.detach()
+
+
+def _default_tile_transform(tiles: List[np.ndarray]):
+    """Stack RGB uint8 tiles into an ImageNet-normalized float tensor (B, 3, H, W)."""
+    import torch
+    arr = np.stack(tiles).astype('float32') / 255.0
+    arr = (arr - np.array(IMAGENET_MEAN, dtype='float32')) / np.array(IMAGENET_STD, dtype='float32')
+    return torch.from_numpy(arr).permute(0, 3, 1, 2).contiguous()
+
+
+def _iter_wsi_grid(slide, tile_size: int, level: int) -> Iterator[Tuple[int, int, Tuple[int, int]]]:
+    """Yield (row, col, level-0 location) over a non-overlapping grid at the given level."""
+    width, height = slide.level_dimensions[level]
+    ds = slide.level_downsamples[level]
+    for r in range(height // tile_size):
+        for c in range(width // tile_size):
+            yield r, c, (int(c * tile_size * ds), int(r * tile_size * ds))
+
+
+def gradcam_slide_heatmap(
+    model=None,
+    target_layer=None,
+    wsi_path: Optional[Union[str, Path]] = None,
+    *,
+    class_idx: int,
+    tile_size: int = 224,
+    level: int = 0,
+    batch_size: int = 16,
+    cells_per_tile: int = 8,
+    transform: Optional[Callable] = None,
+    background_threshold: Optional[float] = 0.85,
+    transparent_threshold: float = 0.5,
+    max_tiles: Optional[int] = None,
+    engine: Optional[GradCAM] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Explain one class over a full slide by streaming batched Grad-CAM over WSI tiles.
+
+    Tiles are read, explained and pooled one batch at a time, so peak memory is
+    bounded by `batch_size` tiles plus the output map of
+    (rows * cells_per_tile, cols * cells_per_tile) float32 cells.
+
+    - class_idx: the single class explained on every tile, so all tiles share one
+      saliency scale and the map reads as evidence for that class.
+    - engine: an existing GradCAM to reuse (its hook stays registered); otherwise
+      a temporary one is built from `model` and `target_layer`.
+    - wsi_path: slide to explain; defaults to get_wsi_path(get_data_dir()).
+    - transform: callable mapping a list of RGB uint8 tiles to a (B, 3, H, W) tensor.
+    - background_threshold: skip tiles whose mean intensity (0-1) exceeds it; None keeps all.
+    - transparent_threshold: skip tiles whose fraction of alpha-0 pixels (outside the
+      scanned area) exceeds it.
+    - max_tiles: optional cap on explained tiles (useful for quick demos).
+    The model is put in eval mode for the run and its previous mode is restored.
+    Returns (heatmap, pred_grid): the saliency map scaled to [0, 1] (skipped tiles
+    stay 0) and a (rows, cols) grid of each tile's predicted class (-1 if skipped).
+    """
+    import torch.nn.functional as F
+    from openslide import OpenSlide  # type: ignore
+
+    if engine is None and (model is None or target_layer is None):
+        raise ValueError("Pass either a GradCAM engine or both model and target_layer.")
+    model = engine.model if engine is not None else model
+
+    was_training = model.training
+    owned_engine = None
+    slide = None
+    try:
+        if engine is None:
+            owned_engine = engine = GradCAM(model, target_layer)
+        if wsi_path is None:
+            try:
+                from shared.utils import get_data_dir, get_wsi_path
+            except ImportError:
+                from utils import get_data_dir, get_wsi_path
+            wsi_path = get_wsi_path(get_data_dir())
+        transform = transform or _default_tile_transform
+        device = next(model.parameters()).device
+
+        model.eval()
+        slide = OpenSlide(str(wsi_path))
+        width, height = slide.level_dimensions[level]
+        rows, cols = height // tile_size, width // tile_size
+        heatmap = np.zeros((rows * cells_per_tile, cols * cells_per_tile), dtype='float32')
+        pred_grid = np.full((rows, cols), -1, dtype='int64')
+        done = 0
+
+        def flush(coords: List[Tuple[int, int]], tiles: List[np.ndarray]):
+            x = transform(tiles).to(device)
+            cams, logits = engine(x, class_idx=class_idx, upsample=False, normalize=False)
+            # Pool every CAM in the batch to the output cell grid at once
+            cells = F.adaptive_avg_pool2d(cams.unsqueeze(1), cells_per_tile).squeeze(1).cpu().numpy()
+            preds = logits.argmax(dim=1).cpu().numpy()
+            for (r, c), cell, pred in zip(coords, cells, preds):
+                heatmap[r * cells_per_tile:(r + 1) * cells_per_tile,
+                        c * cells_per_tile:(c + 1) * cells_per_tile] = cell
+                pred_grid[r, c] = pred
+
+        coords: List[Tuple[int, int]] = []
+        tiles: List[np.ndarray] = []
+        for r, c, loc in _iter_wsi_grid(slide, tile_size, level):
+            if max_tiles is not None and done >= max_tiles:
+                break
+            rgba = np.asarray(slide.read_region(loc, level, (tile_size, tile_size)))
+            if (rgba[..., 3] == 0).mean() > transparent_threshold:
+                continue
+            tile = rgba[..., :3]
+            if background_threshold is not None and tile.mean() / 255.0 > background_threshold:
+                continue
+            coords.append((r, c))
+            tiles.append(tile)
+            done += 1
+            if len(tiles) == batch_size:
+                flush(coords, tiles)
+                coords, tiles = [], []
+        if tiles:
+            flush(coords, tiles)
+    finally:
+        if slide is not None:
+            slide.close()
+        if owned_engine is not None:
+            owned_engine.remove()
+        model.train(was_training)
+
+    hi = heatmap.max()
+    if hi > 0:
+        heatmap /= hi
+    print(f"✅ Grad-CAM (class {class_idx}) computed for {done} tiles -> heatmap {heatmap.shape}")
+    return heatmap, pred_grid
@@ -0,0 +1,199 @@
+# Smoke tests for shared/explainability.py using a tiny conv net
+import sys
+import types
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip('numpy')
+torch = pytest.importorskip('torch')
+nn = torch.nn
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from shared.explainability import GradCAM, gradcam_slide_heatmap  # noqa: E402
+
+BATCH, CLASSES, SIZE = 4, 3, 16
+
+
+def _tiny_net():
+    torch.manual_seed(0)
+    net = nn.Sequential(
+        nn.Conv2d(3, 8, 3, padding=1),
+        nn.BatchNorm2d(8),
+        nn.ReLU(),
+        nn.Conv2d(8, 8, 3, padding=1),
+        nn.ReLU(),
+        nn.AdaptiveAvgPool2d(1),
+        nn.Flatten(),
+        nn.Linear(8, CLASSES),
+    )
+    # Positive head weights and conv bias keep every sample's CAM above zero
+    with torch.no_grad():
+        net[3].bias.fill_(1.0)
+        net[7].weight.uniform_(0.1, 1.0)
+    return net.eval(), net[3]
+
+
+def _batch():
+    torch.manual_seed(1)
+    return torch.rand(BATCH, 3, SIZE, SIZE)
+
+
+@pytest.mark.parametrize('class_idx', [
+    None,
+    1,
+    np.int64(1),
+    torch.tensor(1),
+    [0, 1, 2, 1],
+    torch.tensor([0, 1, 2, 1]),
+])
+def test_gradcam_batch_nonzero_for_every_sample(class_idx):
+    model, layer = _tiny_net()
+    with GradCAM(model, layer) as cam:
+        cams, logits = cam(_batch(), class_idx=class_idx)
+    assert cams.shape == (BATCH, SIZE, SIZE)
+    assert logits.shape == (BATCH, CLASSES)
+    assert (cams.flatten(1).amax(dim=1) > 0).all()
+
+
+def test_gradcam_matches_per_sample_passes_without_param_grads():
+    model, layer = _tiny_net()
+    x = _batch()
+    with GradCAM(model, layer) as cam:
+        batched, _ = cam(x, class_idx=2, upsample=False, normalize=False)
+        single = torch.cat([cam(x[i:i + 1], class_idx=2, upsample=False, normalize=False)[0]
+                            for i in range(BATCH)])
+    assert torch.allclose(batched, single, atol=1e-5)
+    assert all(p.grad is None for p in model.parameters())
+
+
+def test_gradcam_rejects_bad_class_idx_and_train_mode():
+    model, layer = _tiny_net()
+    with GradCAM(model, layer) as cam:
+        with pytest.raises(ValueError):
+            cam(_batch(), class_idx=[0, 1])
+        model.train()
+        with pytest.raises(RuntimeError):
+            cam(_batch())
+
+
+def test_gradcam_hook_is_inert_outside_call():
+    model, layer = _tiny_net()
+    with GradCAM(model, layer) as cam:
+        with torch.no_grad():
+            logits = model(_batch())
+        assert cam._out is None
+        assert not logits.requires_grad
+
+
+def test_gradcam_frozen_net_with_inplace_relu():
+    torch.manual_seed(0)
+    model = nn.Sequential(
+        nn.Conv2d(3, 8, 3, padding=1),
+        nn.ReLU(inplace=True),
+        nn.AdaptiveAvgPool2d(1),
+        nn.Flatten(),
+        nn.Linear(8, CLASSES),
+    )
+    with torch.no_grad():
+        model[0].bias.fill_(1.0)
+        model[4].weight.uniform_(0.1, 1.0)
+    model.eval().requires_grad_(False)
+    with GradCAM(model, model[0]) as cam:
+        cams, _ = cam(_batch(), class_idx=0)
+    assert cams.shape == (BATCH, SIZE, SIZE)
+    assert (cams.flatten(1).amax(dim=1) > 0).all()
+
+
+def test_gradcam_after_remove_raises():
+    model, layer = _tiny_net()
+    cam = GradCAM(model, layer)
+    cam.remove()
+    with pytest.raises(RuntimeError):
+        cam(_batch())
+
+
+# Slide layout for the fake OpenSlide: ROWS x COLS tiles of SIZE px
+ROWS, COLS, CELLS = 3, 4, 2
+WHITE, TRANSPARENT = (0, 1), (1, 2)
+
+
+def _fake_openslide(reads):
+    Image = pytest.importorskip('PIL.Image')
+
+    class FakeSlide:
+        level_dimensions = [(COLS * SIZE, ROWS * SIZE)]
+        level_downsamples = [1.0]
+
+        def __init__(self, path):
+            self.closed = False
+
+        def read_region(self, loc, level, size):
+            r, c = loc[1] // SIZE, loc[0] // SIZE
+            reads.append((r, c))
+            rng = np.random.default_rng(r * COLS + c)
+            rgba = np.empty((size[1], size[0], 4), dtype='uint8')
+            rgba[..., :3] = rng.integers(40, 180, size=(size[1], size[0], 3))
+            rgba[..., 3] = 255
+            if (r, c) == WHITE:
+                rgba[..., :3] = 255
+            if (r, c) == TRANSPARENT:
+                rgba[...] = 0
+            return Image.fromarray(rgba)
+
+        def close(self):
+            self.closed = True
+
+    module = types.ModuleType('openslide')
+    module.OpenSlide = FakeSlide
+    return module
+
+
+def _explained(heatmap):
+    cells = heatmap.reshape(ROWS, CELLS, COLS, CELLS).max(axis=(1, 3))
+    return {(r, c) for r in range(ROWS) for c in range(COLS) if cells[r, c] > 0}
+
+
+def test_slide_heatmap_streams_tiles_into_place(monkeypatch):
+    reads = []
+    monkeypatch.setitem(sys.modules, 'openslide', _fake_openslide(reads))
+    model, layer = _tiny_net()
+    model.train()
+    # 10 kept tiles with batch_size=4 leaves a final partial batch of 2
+    heatmap, preds = gradcam_slide_heatmap(model, layer, 'fake.svs', class_idx=1, tile_size=SIZE,
+                                           batch_size=4, cells_per_tile=CELLS)
+    assert heatmap.shape == (ROWS * CELLS, COLS * CELLS)
+    assert preds.shape == (ROWS, COLS)
+    kept = {(r, c) for r in range(ROWS) for c in range(COLS)} - {WHITE, TRANSPARENT}
+    assert _explained(heatmap) == kept
+    assert preds[WHITE] == -1 and preds[TRANSPARENT] == -1
+    assert all(0 <= preds[t] < CLASSES for t in kept)
+    assert heatmap.max() == pytest.approx(1.0)
+    assert model.training
+    assert len(layer._forward_hooks) == 0
+
+
+def test_slide_heatmap_max_tiles_across_batches(monkeypatch):
+    reads = []
+    monkeypatch.setitem(sys.modules, 'openslide', _fake_openslide(reads))
+    model, layer = _tiny_net()
+    heatmap, _ = gradcam_slide_heatmap(model, layer, 'fake.svs', class_idx=1, tile_size=SIZE,
+                                       batch_size=4, cells_per_tile=CELLS, max_tiles=5)
+    order = [(r, c) for r in range(ROWS) for c in range(COLS)]
+    first_kept = [t for t in order if t not in (WHITE, TRANSPARENT)][:5]
+    assert _explained(heatmap) == set(first_kept)
+    # Reading stops right after the fifth kept tile
+    assert reads == order[:order.index(first_kept[-1]) + 1]
+    assert not model.training
+
+
+def test_slide_heatmap_reuses_engine(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'openslide', _fake_openslide([]))
+    model, layer = _tiny_net()
+    with GradCAM(model, layer) as cam:
+        gradcam_slide_heatmap(wsi_path='fake.svs', engine=cam, class_idx=0, tile_size=SIZE,
+                              batch_size=4, cells_per_tile=CELLS, max_tiles=2)
+        assert len(layer._forward_hooks) == 1
+        cams, _ = cam(_batch())
+        assert cams.shape == (BATCH, SIZE, SIZE)
+    assert len(layer._forward_hooks) == 0